@@ -1,17 +1,22 @@
 #!/usr/bin/env python3
 import argparse
+import gzip
+import json
 import os
 import re
-import xml.etree.ElementTree as ET
-from collections import defaultdict
-from dataclasses import asdict, dataclass, make_dataclass
-from itertools import pairwise
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields, make_dataclass
+from functools import lru_cache
+from itertools import chain, product
+from operator import attrgetter, itemgetter
 from pathlib import Path
 
 import requests
 import tabulate
 from dotenv import load_dotenv
-from lxml import html
+from lxml import etree, html
+from requests.adapters import HTTPAdapter, Retry
 
 load_dotenv()
 
@@ -21,12 +26,62 @@ USERNAME = os.environ.get('CSU_USERNAME')
 PASSWORD = os.environ.get('CSU_PASSWORD')
 DEFAULT_ACAD = os.environ.get('DEFAULT_ACAD', 'GRAD')
 
+# Maximum number of concurrent requests to CampusNet
+MAX_WORKERS = 16
+
+_NORMALIZE_RE = re.compile(r'\W|^(?=\d)')
+# response validators and the request headers used to revalidate them
+_CONDITIONAL_HEADERS = {
+    'ETag': 'If-None-Match',
+    'Last-Modified': 'If-Modified-Since',
+}
+
+# comments surrounding the term choices on the search registration page
+_TERMS_START = '<!--  Display Term Choices'
+_TERMS_END = '<!--  Display Career Choices'
+_VALUE_RE = re.compile(r'value="(.*?)"')
+_TERM_ID_RE = re.compile(r'^\d+-')
+_SUBJECT_RE = re.compile(rb'<Subject>([^<&]+)</Subject>')
+_RELATED_CLASSES_RE = re.compile(
+    r'To enroll in .*?, first select from the class\(es\) above\.You will then be required to select from the related class\(es\) below.',
+    re.DOTALL
+)
+
+# parsers for the HTML fragments embedded in XML responses. lxml only
+# parses concurrently with parsers that aren't shared between threads, so
+# each thread gets its own
+_html_parsers = threading.local()
+
+_CELLS = etree.XPath('.//td')
+_TD_TEXT = etree.XPath('string(.)')
+
+# section fields and column headers displayed by print_courses
+_TABLE_FIELDS = attrgetter(
+    'days', 'name', 'topic', 'time', 'enrltot', 'classnr', 'sect'
+)
+_TABLE_HEADERS = ('Days', 'Name', 'Time', 'Enrolled', 'ClassNr', 'Section')
+
+# <td> cells of the first details table whose leading text ends with a
+# colon, ie: "Session:"
+_DETAIL_LABELS = etree.XPath(
+    "(table/tr/td/table)[1]//td"
+    "[node()[1][self::text()][substring(., string-length(.)) = ':']]"
+)
+_NEXT_TD = etree.XPath('following::td[1]')
+
+# <td> cells whose first non-blank text is the course description label
+_DESCRIPTION_TDS = etree.XPath(
+    "(table/tr/td)[1]//td"
+    "[normalize-space((.//text()[normalize-space()])[1])"
+    " = 'Course Description:']"
+)
+
 
 class CampusException(Exception):
     ...
 
 
-@dataclass
+@dataclass(slots=True)
 class CourseSearchResult:
     name: str | None
     topic: str | None
@@ -45,7 +100,7 @@ class CourseSearchResult:
     sess: str | None
 
 
-@dataclass
+@dataclass(slots=True)
 class CourseDetailResult:
     session: str | None
     consent: str | None
@@ -59,14 +114,29 @@ class CourseDetailResult:
     description: str | None
 
 
-@dataclass
-class Course(CourseDetailResult, CourseSearchResult):
+def _course_from_instances(
+    cls, search: CourseSearchResult, details: CourseDetailResult
+):
+    return cls(
+        *(getattr(search, f.name) for f in fields(search)),
+        *(getattr(details, f.name) for f in fields(details)),
+    )
 
-    @classmethod
-    def from_instances(
-        cls, search: CourseSearchResult, details: CourseDetailResult
-    ):
-        return cls(**asdict(search) | asdict(details))
+
+# slotted dataclasses can't be combined through multiple inheritance (their
+# layouts conflict), so Course is built from the fields of both instead
+Course = make_dataclass(
+    'Course', [
+        (f.name, f.type)
+        for f in fields(CourseSearchResult) + fields(CourseDetailResult)
+    ],
+    namespace={
+        '__module__': __name__,
+        'from_instances': classmethod(_course_from_instances),
+    },
+    slots=True,
+    frozen=True
+)
 
 
 def generate_course_class():
@@ -82,18 +152,19 @@ def generate_course_class():
         )
     ) + ['name', 'topic']
 
-    fields = [(f, str) for f in headings]
-    return make_dataclass('CourseSearchResult', fields)
+    field_types = [(f, str) for f in headings]
+    return make_dataclass('CourseSearchResult', field_types)
 
 
+@lru_cache(maxsize=256)
 def normalize(s: str):
-    s = s.strip().lower()
-    return re.sub(r'\W|^(?=\d)', '', s)
+    return _NORMALIZE_RE.sub('', s.strip().lower())
 
 
 class CampusNet:
 
     cachedir = Path(__file__).parent / 'cache'
+    ajax_url = 'https://campusnet.csuohio.edu/AJAX/AJAXMasterServlet'
     headers = {
         "Accept": "*/*",
         "Priority": "u=0",
@@ -112,13 +183,51 @@ class CampusNet:
         self.username = username
         self.password = password
         self.session = requests.Session()
+        self.session.headers.update(self.headers)
+
+        # in-process caches of already retrieved subjects, terms and details
+        self._subjects_cache: dict[tuple[str, str], list[str]] = {}
+        self._terms_cache: list[str] | None = None
+        self._details_cache: dict[tuple[str, str, str],
+                                  CourseDetailResult] = {}
+
+        # names of the files in each cache directory, listed once on first use
+        self._cache_listing: dict[Path, set[str]] = {}
+
+        # all requests go to a single host, so keep one pool of keep-alive
+        # connections sized to match the number of worker threads, and retry
+        # transient server errors with backoff
+        retry = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=MAX_WORKERS,
+            pool_block=False,
+            max_retries=retry
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
 
     @property
     def authenticated(self):
-        r = self.session.get(
-            'https://campusnet.csuohio.edu/sec/personal/persdata.jsp'
-        )
-        return 'Session Expired' not in r.text
+        # the page is served either way, so scan the body for the expiry
+        # notice and stop downloading as soon as it's found
+        marker = b'Session Expired'
+        tail = b''
+        with self.session.get(
+            'https://campusnet.csuohio.edu/sec/personal/persdata.jsp',
+            stream=True
+        ) as r:
+            for chunk in r.iter_content(chunk_size=16384):
+                if marker in tail + chunk:
+                    return False
+                tail = (tail + chunk)[-(len(marker) - 1):]
+        return True
 
     def login(self, username=None, password=None):
         if username:
@@ -138,29 +247,41 @@ class CampusNet:
         }
         response = self.session.post(
             "https://campusnet.csuohio.edu/ps8verify.jsp",
-            data=paramsPost,
-            headers=self.headers
+            data=paramsPost
         )
 
-        if 'Login in progress' not in response.text:
-            raise CampusException('Login failed!\n%s' % response.text)
+        text = _decode(response.content)
+        if 'Login in progress' not in text:
+            raise CampusException('Login failed!\n%s' % text)
 
     def subjects(self, term, acad=DEFAULT_ACAD, load_cache=True) -> list[str]:
 
-        def parse(xml: str) -> list[str]:
-            root = ET.fromstring(xml)
+        def parse(xml: bytes) -> list[str]:
+            # the subject list is flat, so scan it without building a tree
+            # unless some subject isn't plain text (entities, attributes)
+            matches = _SUBJECT_RE.findall(xml)
+            if matches and len(matches) == xml.count(b'</Subject>'):
+                return [m.decode() for m in matches]
+
+            root = etree.fromstring(xml)
             subject_list = root.find('SubjectList')
             if subject_list is None:
                 return []
             return [
-                c.text for c in subject_list if c.tag == 'Subject' and c.text
+                c.text for c in subject_list.iterchildren('Subject') if c.text
             ]
 
-        path = self.cachedir / f'subjects_{term}_{acad}.txt'
+        if load_cache and (term, acad) in self._subjects_cache:
+            return self._subjects_cache[term, acad]
+
+        path = self.cachedir / f'subjects_{term}_{acad}.xml.gz'
 
-        if load_cache and path.exists():
-            with open(path) as f:
-                return parse(f.read())
+        # cached subjects are revalidated below, unless they were saved
+        # without validators
+        if load_cache and path.exists() and not _meta_path(path).exists():
+            subjects = parse(gzip.decompress(path.read_bytes()))
+            self._subjects_cache[term, acad] = subjects
+            return subjects
 
         paramsGet = {
             "college": "",
@@ -171,67 +292,157 @@ class CampusNet:
             "location": "",
             "term": term,
         }
-        response = self.session.get(
-            "https://campusnet.csuohio.edu/AJAX/AJAXMasterServlet",
-            params=paramsGet,
-            headers=self.headers
+        response = self._conditional_get(
+            self.ajax_url, path, params=paramsGet
         )
 
-        if load_cache:
-            path.parent.mkdir(parents=True, exist_ok=True)
-            with open(path, 'w') as f:
-                f.write(response.text)
+        if response.status_code == 304:  # cached copy is still current
+            subjects = self._subjects_cache.get((term, acad))
+            if subjects is None:
+                subjects = parse(gzip.decompress(path.read_bytes()))
+        else:
+            content = response.content
+            if load_cache:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(gzip.compress(content, compresslevel=3))
+                self._save_validators(response, path)
+            subjects = parse(content)
 
-        return parse(response.text)
+        self._subjects_cache[term, acad] = subjects
+        return subjects
 
     def terms(self, load_cache=True):
         '''Visits the course search page and returns available terms'''
 
+        def read_cache():
+            lines = path.read_text(encoding='utf-8').splitlines()
+            return [line.strip() for line in lines if line.strip()]
+
+        if load_cache and self._terms_cache is not None:
+            return self._terms_cache
+
         path = self.cachedir / 'terms.txt'
 
-        if load_cache and path.exists():
-            with open(path) as f:
-                return [line.strip() for line in f if line.strip()]
+        # cached terms are revalidated below, unless they were saved without
+        # validators
+        if load_cache and path.exists() and not _meta_path(path).exists():
+            self._terms_cache = read_cache()
+            return self._terms_cache
 
-        r = self.session.get(
-            'https://campusnet.csuohio.edu/sec/classsearch/search_reg.jsp'
+        r = self._conditional_get(
+            'https://campusnet.csuohio.edu/sec/classsearch/search_reg.jsp',
+            path
         )
 
-        text_start = '<!--  Display Term Choices'
-        text_end = '<!--  Display Career Choices'
-        pattern = re.escape(text_start) + '(.*?)' + re.escape(text_end)
+        if r.status_code == 304:  # cached terms are still current
+            if self._terms_cache is None:
+                self._terms_cache = read_cache()
+            return self._terms_cache
+
+        text = _decode(r.content)
+        start = text.find(_TERMS_START)
+        end = text.find(_TERMS_END, start + len(_TERMS_START))
 
-        if text := re.search(pattern, r.text, re.DOTALL):
-            term_list = re.findall('value="(.*?)"', text.group(1))
+        if start >= 0 and end >= 0:
+            block = text[start + len(_TERMS_START):end]
+            term_list = _VALUE_RE.findall(block)
             path.parent.mkdir(parents=True, exist_ok=True)
-            with open(path, 'w') as f:
-                f.write('\n'.join(term_list))
+            path.write_text('\n'.join(term_list), encoding='utf-8')
+            self._save_validators(r, path)
+            self._terms_cache = term_list
             return term_list
 
         raise CampusException(
             'Failed to find terms on search registration page'
         )
 
-    def find_courses(self, term, subject, acad=DEFAULT_ACAD, load_cache=True):
-        '''Retrieves a course list from CampusNet or from local cache'''
+    def _conditional_get(self, url, path, **kwargs):
+        '''Sends a GET request which revalidates the cache file at the given
+        path using the validators saved with it. The server responds with
+        304 Not Modified if the cached copy is still current'''
+
+        headers = {}
+        meta_path = _meta_path(path)
+        if path.exists() and meta_path.exists():
+            validators = json.loads(meta_path.read_text(encoding='utf-8'))
+            headers = {
+                _CONDITIONAL_HEADERS[k]: v
+                for k, v in validators.items() if k in _CONDITIONAL_HEADERS
+            }
+        return self.session.get(url, headers=headers, **kwargs)
 
-        def retrieve_xml():
-            path = self.cachedir / 'search' / f'{term}_{subject}.xml'
+    def _save_validators(self, response, path):
+        '''Saves the response's ETag/Last-Modified validators alongside the
+        cache file at the given path'''
 
-            if load_cache and path.exists():
-                return open(path).read()
+        meta_path = _meta_path(path)
+        validators = {
+            k: response.headers[k]
+            for k in _CONDITIONAL_HEADERS if k in response.headers
+        }
+        if validators:
+            meta_path.write_text(json.dumps(validators), encoding='utf-8')
+        else:
+            meta_path.unlink(missing_ok=True)
+
+    def is_cached(self, path: Path) -> bool:
+        '''Checks if the given cache file exists. Each cache directory is
+        scanned once instead of stat-ing every file separately'''
+        return path.name in self._cache_names(path.parent)
+
+    def _cache_names(self, directory: Path) -> set[str]:
+        names = self._cache_listing.get(directory)
+        if names is None:
+            try:
+                with os.scandir(directory) as it:
+                    names = {entry.name for entry in it}
+            except FileNotFoundError:
+                names = set()
+            # another thread may have listed the directory in the meantime
+            names = self._cache_listing.setdefault(directory, names)
+        return names
+
+    def _mark_cached(self, path: Path):
+        self._cache_names(path.parent).add(path.name)
 
+    def find_courses(self, term, subject, acad=DEFAULT_ACAD, load_cache=True):
+        '''Retrieves a course list from CampusNet or from local cache. This
+        may run on worker threads, so it doesn't print anything'''
+
+        path = self.search_cache_path(term, subject)
+        parsed_path = self.cachedir / 'parsed' / f'{term}_{subject}.json'
+
+        if load_cache and self.is_cached(path):
+            # reuse the parsed courses if they were parsed from this copy of
+            # the raw response, which is identified by its modification time
+            mtime = path.stat().st_mtime_ns
+            if self.is_cached(parsed_path):
+                courses = load_courses_json(parsed_path.read_bytes(), mtime)
+                if courses is not None:
+                    return courses
+
+            courses = parse_course_search_xml(
+                gzip.decompress(path.read_bytes())
+            )
+        else:
             path.parent.mkdir(parents=True, exist_ok=True)
-            resp_text = self._search_courses(term, subject, acad)
+            content, root = self._search_courses(term, subject, acad)
 
-            print('Caching results to', path)
-            open(path, 'w').write(resp_text)
-            return resp_text
+            path.write_bytes(gzip.compress(content, compresslevel=3))
+            self._mark_cached(path)
+            mtime = path.stat().st_mtime_ns
+            courses = parse_course_search_xml(content, root)
 
-        return parse_course_search_xml(retrieve_xml())
+        parsed_path.parent.mkdir(parents=True, exist_ok=True)
+        parsed_path.write_text(
+            dump_courses_json(courses, mtime), encoding='utf-8'
+        )
+        self._mark_cached(parsed_path)
+        return courses
 
     def _search_courses(self, term, subject, acad):
-        '''Retrieves a course list from CampusNet'''
+        '''Retrieves a course list from CampusNet, returning the response
+        body and its parsed root element'''
 
         paramsGet = {
             "thu": "N",
@@ -251,29 +462,53 @@ class CampusNet:
             "fri": "N",
             "incl": "I"
         }
-        response = self.session.get(
-            "https://campusnet.csuohio.edu/AJAX/AJAXMasterServlet",
-            params=paramsGet,
-            headers=self.headers
-        )
-
+        return self._get_xml(paramsGet)
+
+    def _get_xml(self, params):
+        '''Streams an AJAX response into an XML parser while it downloads.
+        Returns the raw response body and its parsed root element (or None
+        if the response isn't well-formed XML)'''
+
+        parser = etree.XMLParser()
+        chunks = []
+        with self.session.get(
+            self.ajax_url, params=params, stream=True
+        ) as response:
+            for chunk in response.iter_content(chunk_size=16384):
+                chunks.append(chunk)
+                if parser is not None:
+                    try:
+                        parser.feed(chunk)
+                    except etree.XMLSyntaxError:
+                        parser = None
+
+        content = b''.join(chunks)
         assert response.ok, 'HTTP Error: %d %s' % (
             response.status_code,
-            response.text,
+            _decode(content),
         )
-        return response.text
+
+        try:
+            root = parser.close() if parser is not None else None
+        except etree.XMLSyntaxError:
+            root = None
+        return content, root
 
     def class_details(self, termNbr, classNbr, acad, load_cache=True):
+        '''Retrieves a class's details from CampusNet or from local cache.
+        This may run on worker threads, so it doesn't print anything'''
 
         def process():
-            if load_cache and path.exists():
-                return parse_course_details_xml(open(path).read())
+            if load_cache and self.is_cached(path):
+                return parse_course_details_xml(
+                    gzip.decompress(path.read_bytes())
+                )
 
-            resp_xml = query()
-            result = parse_course_details_xml(resp_xml)
-            print('Caching results to', path)
+            content, root = query()
+            result = parse_course_details_xml(content, root)
             path.parent.mkdir(parents=True, exist_ok=True)
-            open(path, 'w').write(resp_xml)
+            path.write_bytes(gzip.compress(content, compresslevel=3))
+            self._mark_cached(path)
             return result
 
         def query():
@@ -284,70 +519,153 @@ class CampusNet:
                 "function": "getClassDetails",
                 "term": termNbr,
             }
-            return self.session.get(
-                "https://campusnet.csuohio.edu/AJAX/AJAXMasterServlet",
-                params=paramsGet
-            ).text
+            return self._get_xml(paramsGet)
+
+        key = (termNbr, classNbr, acad)
+        if load_cache and key in self._details_cache:
+            return self._details_cache[key]
+
+        path = self.details_cache_path(termNbr, classNbr, acad)
+        self._details_cache[key] = details = process()
+        return details
+
+    def search_cache_path(self, term, subject) -> Path:
+        '''Returns the cache path of the given course search results'''
+        return self.cachedir / 'search' / f'{term}_{subject}.xml.gz'
+
+    def details_cache_path(self, termNbr, classNbr, acad) -> Path:
+        '''Returns the cache path of the given class's details'''
+        filename = f'{termNbr}_{classNbr}_{acad}.xml.gz'
+        return self.cachedir / 'details' / filename
+
+
+def _meta_path(path: Path) -> Path:
+    '''Returns the path of the validators saved with a cache file'''
+    return path.with_name(path.name + '.meta')
+
+
+def _html_parser() -> html.HTMLParser:
+    parser = getattr(_html_parsers, 'parser', None)
+    if parser is None:
+        parser = _html_parsers.parser = html.HTMLParser()
+    return parser
+
 
-        path = self.cachedir / 'details' / f'{termNbr}_{classNbr}_{acad}.xml'
-        return process()
+def _decode(response: bytes) -> str:
+    return response.decode('utf-8', errors='replace')
 
 
 def parse_course_search_xml(
-    response_xml: str
+    response_xml: bytes,
+    root: etree._Element | None = None
 ) -> dict[str, list[CourseSearchResult]]:
     '''Constructs a dictionary of course names to sections given an XML
-    response from the course search endpoint'''
+    response from the course search endpoint. The response's root element
+    can be passed if it was already parsed'''
 
-    root = ET.fromstring(response_xml)
+    if root is None:
+        root = etree.fromstring(response_xml)
 
     error_code = root.find('ErrorCode')
     if error_code is not None:
-        if error_code.text == 'CSTCLS_NOCL2':
-            print('WARNING: No classes found')
+        if error_code.text == 'CSTCLS_NOCL2':  # no classes found
             return {}
-        raise CampusException(f'API Error:\n{response_xml}')
+        raise CampusException(f'API Error:\n{_decode(response_xml)}')
 
     classlist = root.find('ClassList')
     if classlist is None or not classlist.text:
         raise CampusException(
-            f'Expected ClassList tag in search response:\n{response_xml}'
+            'Expected ClassList tag in search response:\n' +
+            _decode(response_xml)
         )
 
-    table = html.fromstring(classlist.text)
-    assert table.tag == 'table', f'Expected table tag, got: {table.tag}'
-
-    headings, *rows = [
-        [''.join(td.itertext()).strip() for td in tr.iter('td')]
-        for tr in table.iter('tr')
-    ]
+    rows = iter_table_rows(classlist.text)
+    headings = next(rows, None)
+    assert headings is not None, 'Expected a heading row in ClassList table'
     norm_headings = list(map(normalize, headings))
 
-    courses = defaultdict(list)
-    name = None
+    # column of each section field after name, in CourseSearchResult's field
+    # order, so sections can be constructed positionally. topic and sess have
+    # no column and read the blank cell appended to each row
+    section_fields = [f.name for f in fields(CourseSearchResult)[1:]]
+    unknown = [k for k in norm_headings if k and k not in section_fields]
+    assert not unknown, f'Unexpected ClassList columns: {unknown}'
+    missing = [
+        k for k in section_fields
+        if k not in norm_headings and k not in ('topic', 'sess')
+    ]
+    assert not missing, f'Missing ClassList columns: {missing}'
+    pick = itemgetter(*(
+        norm_headings.index(k) if k in norm_headings else -1
+        for k in section_fields
+    ))
+
+    # sections are grouped under their course's title row, so append to the
+    # current course's list rather than looking it up for every section
+    courses = {}
+    name = sections = None
     for r in rows:
         if len(r) == 1:  # course title, ie: CIS  895 Doctoral Research
             name = r[0]
+            sections = courses.setdefault(name, [])
         elif len(r) == len(headings):  # course info
             assert name is not None, 'Found section before course name'
-            kwargs = {'sess': None}
-            kwargs |= {k: v or None for k, v in zip(norm_headings, r) if k}
-            courses[name].append(
-                CourseSearchResult(name=name, topic=None, **kwargs)
+            r.append('')
+            sections.append(
+                CourseSearchResult(name, *[v or None for v in pick(r)])
             )
         elif len(r) == 2 and r[0] == '':  # special topic (has a separate row)
             assert name is not None, 'Found topic before course name'
             t = r[1]
             if t.startswith('Topic: '):
                 t = t.split(': ', 1)[-1]
-            courses[name][-1].topic = t
+            sections[-1].topic = t
         else:
             assert r == [''] * 3, f'Unexpected row: {r}'
 
-    return dict(courses)
-
-
-def parse_course_details_xml(response_xml: str):
+    # drop courses listed without any sections
+    return {name: sections for name, sections in courses.items() if sections}
+
+
+def iter_table_rows(html_text: str, chunk_size=16384):
+    '''Incrementally parses an HTML table, yielding the stripped text of each
+    of its rows' cells. Rows of nested tables are only part of their outer
+    row's cells. Rows are freed once they've been processed'''
+
+    parser = etree.HTMLPullParser(events=('start', 'end'))
+    table = None
+
+    def read_rows():
+        nonlocal table
+        for event, elem in parser.read_events():
+            if table is None:
+                # the fragment's root is the first element inside the
+                # html/body elements implied by the parser
+                if event == 'start' and elem.tag not in ('html', 'body'):
+                    assert elem.tag == 'table', \
+                        f'Expected table tag, got: {elem.tag}'
+                    table = elem
+            elif (
+                event == 'end' and elem.tag == 'tr'
+                and next(elem.iterancestors('table')) is table
+            ):
+                yield [_TD_TEXT(td).strip() for td in _CELLS(elem)]
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+
+    for i in range(0, len(html_text), chunk_size):
+        parser.feed(html_text[i:i + chunk_size])
+        yield from read_rows()
+
+    parser.close()
+    yield from read_rows()
+    assert table is not None, 'Expected table tag, got nothing'
+
+
+def parse_course_details_xml(
+    response_xml: bytes, root: etree._Element | None = None
+):
     '''Parses a subset of details for an individual course.
     More data is available but not yet parsed, such as:
         - combined courses
@@ -355,77 +673,107 @@ def parse_course_details_xml(response_xml: str):
         - data already available from course search
     '''
 
-    try:
-        root = ET.fromstring(response_xml)
-    except Exception as exc:
-        raise Exception('XML Parse Error: %s' % (response_xml, )) from exc
+    if root is None:
+        try:
+            root = etree.fromstring(response_xml)
+        except Exception as exc:
+            raise Exception(
+                'XML Parse Error: %s' % (_decode(response_xml), )
+            ) from exc
 
     error_code = root.find('ErrorCode')
     if error_code is not None:
-        raise CampusException(f'API Error:\n{response_xml}')
+        raise CampusException(f'API Error:\n{_decode(response_xml)}')
 
     classdetails = root.find('ClassDetails')
     if classdetails is None or not classdetails.text:
         raise CampusException(
-            f'Expected ClassDetails tag in search response:\n{response_xml}'
+            'Expected ClassDetails tag in search response:\n' +
+            _decode(response_xml)
         )
 
-    div = html.fromstring(classdetails.text)
+    div = etree.fromstring(classdetails.text, _html_parser()).find('body/*')
     assert div.tag == 'div', f'Expected div tag, got: {div.tag}'
 
     # construct top-level "Attribute: Value" mappings
-    first_table = div.find('table/tr/td/table')
-    first_table_tds = [td.text for td in first_table.iter('td')]
-
     props = {}
-    for td1, td2 in pairwise(first_table_tds):
-        if td1 and td1.endswith(':'):
-            props[td1[:-1]] = td2.strip()
+    for td in _DETAIL_LABELS(div):
+        if value_td := _NEXT_TD(td):
+            props[td.text[:-1]] = (value_td[0].text or '').strip()
+
+    # extract course description
+    for td in _DESCRIPTION_TDS(div):
+        items = [t.strip() for t in td.itertext() if t.strip()]
+        if len(items) > 1:
+            props['Description'] = items[1]
+
+    props_by_field = {normalize(k): v for k, v in props.items()}
+    return CourseDetailResult(**props_by_field)
+
+
+# field names and values of a CourseSearchResult, in positional order
+_SEARCH_FIELDS = [f.name for f in fields(CourseSearchResult)]
+_search_values = attrgetter(*_SEARCH_FIELDS)
+
+
+def dump_courses_json(
+    courses: dict[str, list[CourseSearchResult]], source_mtime: int
+) -> str:
+    '''Serializes parsed course search results to compact JSON, storing each
+    section as a list of field values along with the modification time (in
+    nanoseconds) of the raw response they were parsed from'''
+    return json.dumps(
+        {
+            'fields': _SEARCH_FIELDS,
+            'source_mtime': source_mtime,
+            'courses': {
+                name: [_search_values(section) for section in sections]
+                for name, sections in courses.items()
+            },
+        },
+        separators=(',', ':')
+    )
 
-    # extract course description (very messily)
-    for table in div.find('table/tr/td').iter('table'):
-        for tr in table.iter('tr'):
-            for td in table.iter('td'):
-                if items := [t.strip() for t in td.itertext() if t.strip()]:
-                    if items[0] == 'Course Description:':
-                        props['Description'] = items[1]
 
-    fields = {normalize(k): v for k, v in props.items()}
-    return CourseDetailResult(**fields)
+def load_courses_json(
+    data: str | bytes, source_mtime: int
+) -> dict[str, list[CourseSearchResult]] | None:
+    '''Loads course search results serialized by dump_courses_json. Returns
+    None if they were stored with different fields or parsed from a raw
+    response with a different modification time'''
+    data = json.loads(data)
+    if (
+        data.get('fields') != _SEARCH_FIELDS
+        or data.get('source_mtime') != source_mtime
+    ):
+        return None
+    return {
+        name: [CourseSearchResult(*values) for values in sections]
+        for name, sections in data['courses'].items()
+    }
 
 
 def print_courses(courses: dict[str, list[CourseSearchResult]]):
 
-    def format_name(s: CourseSearchResult):
-        if not s.topic:
-            return s.name
-
-        if re.match(
-            r'To enroll in .*?, first select from the class\(es\) above\.You will then be required to select from the related class\(es\) below.',
-            s.topic,
-            flags=re.DOTALL
-        ):
-            return s.name
-
-        assert s.name, 'name is None or blank'
-        return s.name + ' - ' + s.topic
-
-    table_headers = {
-        'Days': lambda s: s.days,
-        'Name': format_name,
-        'Time': lambda s: s.time,
-        'Enrolled': lambda s: s.enrltot,
-        'ClassNr': lambda s: s.classnr,
-        'Section': lambda s: s.sect,
-    }
+    def format_name(name: str | None, topic: str | None):
+        if not topic:
+            return name
 
-    table = []
-    for sections in courses.values():
-        for section in sections:
-            table.append([f(section) for f in table_headers.values()])
+        if _RELATED_CLASSES_RE.match(topic):
+            return name
+
+        assert name, 'name is None or blank'
+        return name + ' - ' + topic
+
+    table = [
+        (days, format_name(name, topic), time, enrltot, classnr, sect)
+        for days, name, topic, time, enrltot, classnr, sect in map(
+            _TABLE_FIELDS, chain.from_iterable(courses.values())
+        )
+    ]
 
     if table:
-        print(tabulate.tabulate(table, headers=tuple(table_headers.keys())))
+        print(tabulate.tabulate(table, headers=_TABLE_HEADERS))
 
 
 def argument_parser():
@@ -477,25 +825,48 @@ def display_course_details(all_sections, args, net, subject, term):
     # retrieve and print course details
     combined = []
 
-    for term, subject, section in all_sections:
-        if not section.classnr:
-            print(
-                f'\033[93mWARN: Course {section.name} is missing a course number\033[0m'
-            )
-            continue
-        try:
-            termNbr = term.split('-')[0]
-            details = net.class_details(
-                termNbr, section.classnr, acad=args.acad
-            )
-            combined.append(
-                [term, subject,
-                 Course.from_instances(section, details)]
-            )
-        except Exception as exc:
-            raise Exception(
-                f'Error parsing course details for: {term} {subject} {section}'
-            ) from exc
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        sections = []
+        pending = {}
+        for term, subject, section in all_sections:
+            if not section.classnr:
+                print(
+                    f'\033[93mWARN: Course {section.name} is missing a course number\033[0m'
+                )
+                continue
+            key = (term.split('-')[0], section.classnr, args.acad)
+            sections.append((term, subject, section, key))
+
+            # fetch each class once, and only go to the network for classes
+            # that aren't already cached (cached ones are parsed below)
+            if key not in pending:
+                if net.is_cached(net.details_cache_path(*key)):
+                    pending[key] = None
+                else:
+                    pending[key] = executor.submit(net.class_details, *key)
+
+        # collect results in submission order to keep output deterministic
+        details = {}
+        for term, subject, section, key in sections:
+            try:
+                if key not in details:
+                    future = pending[key]
+                    if future:
+                        details[key] = future.result()
+                        print(
+                            'Caching results to',
+                            net.details_cache_path(*key)
+                        )
+                    else:
+                        details[key] = net.class_details(*key)
+                combined.append(
+                    [term, subject,
+                     Course.from_instances(section, details[key])]
+                )
+            except Exception as exc:
+                raise Exception(
+                    f'Error parsing course details for: {term} {subject} {section}'
+                ) from exc
 
     for x in combined:
         print(x[-1])
@@ -508,22 +879,27 @@ def main():
     net = CampusNet(args.username, args.password)
     net.login()
 
-    all_terms = net.terms(load_cache=False)
-
     if not args.terms:
         print(f'\n\033[93;1m# Available Terms\033[0m\n')
         for t in net.terms(load_cache=not args.no_cache):
             print(t)
         return
 
-    # filter terms
-    args.terms = [t.lower() for t in args.terms]
-    args.terms = [
-        t for t in all_terms if t.lower() in args.terms or any(
-            re.search(p,
-                      t.split('-', 1)[-1], re.IGNORECASE) for p in args.terms
-        )
-    ]
+    # filter terms, unless all were given as term IDs (ie: '114-Fall 2025').
+    # Patterns are matched against the live term list, which is cheap to
+    # revalidate when the cached copy is still current
+    if not all(_TERM_ID_RE.match(t) for t in args.terms):
+        all_terms = net.terms(load_cache=False)
+        patterns = [re.compile(p, re.IGNORECASE) for p in args.terms]
+        given = [t.lower() for t in args.terms]
+        args.terms = [
+            t for t in all_terms if t.lower() in given
+            or any(p.search(t.split('-', 1)[-1]) for p in patterns)
+        ]
+        if not args.terms:
+            raise CampusException(
+                'No terms match: ' + ', '.join(p.pattern for p in patterns)
+            )
 
     if not args.subjects:
         print(f'\n\033[93;1m# Available Subjects for {args.terms[0]}\033[0m\n')
@@ -532,21 +908,33 @@ def main():
         )
         print(', '.join(subjects))
 
-    all_sections = []
-    for term in args.terms:
-        for subject in args.subjects:
-            courses = net.find_courses(
-                term, subject, acad=args.acad, load_cache=not args.no_cache
-            )
-
-            if args.format == 'table':
-                print(f'\n\033[93;1m# {term}: {subject}\033[0m\n')
-                print_courses(courses)
+    # search all (term, subject) pairs concurrently, then print in order
+    pairs = list(product(args.terms, args.subjects))
+    fetched = [
+        args.no_cache or not net.is_cached(net.search_cache_path(*pair))
+        for pair in pairs
+    ]
+    max_workers = max(1, min(MAX_WORKERS, len(pairs)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda pair: net.find_courses(
+                *pair, acad=args.acad, load_cache=not args.no_cache
+            ), pairs
+        )
 
-            for sections in courses.values():
-                all_sections += [
-                    (term, subject, section) for section in sections
-                ]
+    all_sections = []
+    for (term, subject), courses, was_fetched in zip(pairs, results, fetched):
+        if was_fetched:
+            print('Caching results to', net.search_cache_path(term, subject))
+        if args.format == 'table':
+            print(f'\n\033[93;1m# {term}: {subject}\033[0m\n')
+        if not courses:
+            print(f'WARNING: No classes found for {term}: {subject}')
+        elif args.format == 'table':
+            print_courses(courses)
+
+        for sections in courses.values():
+            all_sections += [(term, subject, section) for section in sections]
 
     if args.format == 'object':
         display_course_details(all_sections, args, net, subject, term)